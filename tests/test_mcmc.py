@@ -9,6 +9,7 @@ from scipy import stats
 import numpy as np
 import six
 import zhusuan as zs
+from zhusuan.sgmcmc import langevin_step
 
 
 def sample_error_with(sampler, sess, n_chains=1, n_iters=80000, thinning=50,
@@ -86,3 +87,170 @@ class TestSGMCMC(tf.test.TestCase):
         with self.test_session() as sess:
             e = sample_error_with(sampler, sess, n_chains=100, n_iters=8000)
             self.assertLessEqual(e, 0.016)
+
+    def test_use_xla(self):
+        def is_compiled(op):
+            try:
+                return op.get_attr("_XlaCompile")
+            except ValueError:
+                return False
+
+        def log_joint(observed):
+            return -0.5 * tf.reduce_sum(tf.square(observed['x']))
+
+        make_samplers = [
+            lambda: zs.SGLD(learning_rate=0.01, use_xla=True),
+            lambda: zs.PSGLD(learning_rate=0.01, use_xla=True),
+            lambda: zs.SGHMC(learning_rate=0.01, use_xla=True),
+            lambda: zs.SGHMC(learning_rate=0.01, second_order=False,
+                             use_xla=True),
+            lambda: zs.SGNHT(learning_rate=0.01, use_xla=True),
+            lambda: zs.SGNHT(learning_rate=0.01, second_order=False,
+                             use_vector_alpha=False, use_xla=True),
+        ]
+        for make_sampler in make_samplers:
+            with tf.Graph().as_default() as graph:
+                sampler = make_sampler()
+                x = tf.Variable(tf.zeros([3]), trainable=False, name='x')
+                _, info = sampler.sample(log_joint, {}, {'x': x})
+                self.assertTrue(is_compiled(info.q['x'].op))
+                ops = graph.get_operations()
+                self.assertTrue(any(
+                    is_compiled(op) for op in ops
+                    if op.type == "StatelessRandomNormal"))
+                for op in ops:
+                    if op.type.startswith("Assign"):
+                        self.assertFalse(is_compiled(op))
+
+    def test_seed(self):
+        def log_joint(observed):
+            return -0.5 * tf.reduce_sum(tf.square(observed['x']))
+
+        lr = 0.01
+
+        def run_steps(make_sampler, n_steps=3):
+            with self.test_session(graph=tf.Graph()) as sess:
+                tf.set_random_seed(1234)
+                sampler = make_sampler()
+                x = tf.Variable(tf.zeros([5]), trainable=False, name='x')
+                sample_op, info = sampler.sample(log_joint, {}, {'x': x})
+                sess.run(tf.global_variables_initializer())
+                return np.array([sess.run([sample_op, info.q])[1]['x']
+                                 for _ in range(n_steps)])
+
+        make_samplers = [
+            lambda: zs.SGLD(learning_rate=lr),
+            lambda: zs.SGHMC(learning_rate=lr, n_iter_resample_v=2),
+            lambda: zs.SGNHT(learning_rate=lr, n_iter_resample_v=2),
+        ]
+        for make_sampler in make_samplers:
+            self.assertAllEqual(run_steps(make_sampler),
+                                run_steps(make_sampler))
+
+        # Starting from zero, the SGLD steps give q1 = sqrt(lr) * noise1 and
+        # q2 = (1 - lr / 2) * q1 + sqrt(lr) * noise2.
+        q1, q2 = run_steps(make_samplers[0], n_steps=2)
+        noise1 = q1 / np.sqrt(lr)
+        noise2 = (q2 - (1 - 0.5 * lr) * q1) / np.sqrt(lr)
+        self.assertFalse(np.allclose(noise1, noise2))
+
+    def test_psgld_rms_preconditioner(self):
+        hps = zs.PSGLD.RMSPreconditioner.HParams(decay=0.9, epsilon=1e-3)
+        q = np.array([0.5, -1., 2.], dtype=np.float32)
+        grad = np.array([0.3, -2., 0.], dtype=np.float32)
+        aux = np.array([0.1, 0.5, 4.], dtype=np.float32)
+        noise = np.array([1., -0.5, 2.], dtype=np.float32)
+        lr = 0.01
+        with self.test_session() as sess:
+            sqrt_g, new_aux = \
+                zs.PSGLD.RMSPreconditioner._get_sqrt_preconditioner(
+                    hps, tf.constant(q), tf.constant(grad), tf.constant(aux))
+            new_q = langevin_step(tf.constant(q), tf.constant(grad), lr,
+                                  np.sqrt(lr), tf.constant(noise), sqrt_g)
+            g, new_aux, new_q = sess.run(
+                [tf.square(sqrt_g), new_aux, new_q])
+        expected_aux = hps.decay * aux + (1 - hps.decay) * grad**2
+        expected_g = 1. / (hps.epsilon + np.sqrt(expected_aux))
+        self.assertAllClose(new_aux, expected_aux)
+        self.assertAllClose(g, expected_g)
+        self.assertAllClose(
+            new_q,
+            q + 0.5 * lr * expected_g * grad +
+            np.sqrt(lr) * np.sqrt(expected_g) * noise)
+
+    def test_psgld_bfloat16_preconditioner(self):
+        def log_joint(observed):
+            return -0.5 * tf.reduce_sum(tf.square(observed['x']))
+
+        x0 = np.array([0.5, 1., 2., 3.], dtype=np.float32)
+
+        def run_steps(dtype, n_steps=2):
+            with self.test_session(graph=tf.Graph()) as sess:
+                tf.set_random_seed(1234)
+                sampler = zs.PSGLD(learning_rate=0.01,
+                                   preconditioner_dtype=dtype)
+                x = tf.Variable(x0, trainable=False, name='x')
+                sample_op, info = sampler.sample(log_joint, {}, {'x': x})
+                for aux in sampler.vs:
+                    self.assertEqual(aux.dtype.base_dtype, dtype)
+                sess.run(tf.global_variables_initializer())
+                qs, auxs = [], []
+                for _ in range(n_steps):
+                    _, q = sess.run([sample_op, info.q])
+                    qs.append(q['x'])
+                    auxs.append(sess.run(sampler.vs[0]).astype(np.float32))
+            return qs, auxs
+
+        qs_bf16, auxs_bf16 = run_steps(tf.bfloat16)
+        qs_f32, auxs_f32 = run_steps(tf.float32)
+        # The gradient is -q, and the preconditioner starts from zero. The
+        # second step reads the statistics stored after the first one, which
+        # are quantized in the bfloat16 run.
+        decay = zs.PSGLD.RMSPreconditioner.default_hps.decay
+        expected_aux1 = (1 - decay) * x0**2
+        expected_aux2 = decay * expected_aux1 + (1 - decay) * qs_f32[0]**2
+        self.assertAllClose(auxs_f32[0], expected_aux1)
+        self.assertAllClose(auxs_f32[1], expected_aux2)
+        self.assertAllClose(auxs_bf16[0], expected_aux1, rtol=1e-2, atol=1e-3)
+        self.assertAllClose(auxs_bf16[1], expected_aux2, rtol=1e-2, atol=1e-3)
+        self.assertAllClose(qs_bf16[1], qs_f32[1], rtol=1e-2, atol=1e-3)
+
+    def test_sgnht_share_alpha(self):
+        with self.assertRaisesRegexp(ValueError, "share_alpha"):
+            zs.SGNHT(learning_rate=0.01, use_vector_alpha=True,
+                     share_alpha=True)
+
+        def log_joint(observed):
+            return -0.5 * (tf.reduce_sum(tf.square(observed['x'])) +
+                           tf.reduce_sum(tf.square(observed['y'])))
+
+        lr, a, tune_rate = 0.01, 0.1, 0.5
+        for second_order in [True, False]:
+            with self.test_session(graph=tf.Graph()) as sess:
+                sampler = zs.SGNHT(learning_rate=lr, variance_extra=a,
+                                   tune_rate=tune_rate,
+                                   n_iter_resample_v=None,
+                                   second_order=second_order,
+                                   use_vector_alpha=False, share_alpha=True)
+                x = tf.Variable(tf.zeros([3]), trainable=False, name='x')
+                y = tf.Variable(tf.zeros([2, 2]), trainable=False, name='y')
+                sample_op, info = sampler.sample(
+                    log_joint, {}, {'x': x, 'y': y})
+                self.assertEqual(len(sampler.alphas), 1)
+                sess.run(tf.global_variables_initializer())
+                old_vs = sess.run(sampler.vs)
+                _, mean_k, alpha = sess.run(
+                    [sample_op, info.mean_k, info.alpha])
+                new_vs = sess.run(sampler.vs)
+            # The kinetic energy is averaged over all 7 components.
+            old_mean_k = sum(np.sum(v**2) for v in old_vs) / 7
+            new_mean_k = sum(np.sum(v**2) for v in new_vs) / 7
+            self.assertAllClose(mean_k['x'], new_mean_k)
+            self.assertAllClose(mean_k['y'], new_mean_k)
+            if second_order:
+                expected = a + 0.5 * tune_rate * (old_mean_k - lr) + \
+                    0.5 * tune_rate * (new_mean_k - lr)
+            else:
+                expected = a + tune_rate * (new_mean_k - lr)
+            self.assertAllClose(alpha['x'], expected)
+            self.assertAllClose(alpha['y'], expected)
@@ -4,6 +4,8 @@
 from __future__ import absolute_import
 from __future__ import division
 
+from contextlib import contextmanager
+import random
 import six
 from six.moves import zip
 from collections import namedtuple
@@ -21,6 +23,87 @@ __all__ = [
 ]
 
 
+@contextmanager
+def xla_scope(enabled):
+    if not enabled:
+        yield
+        return
+    try:
+        jit_scope = tf.xla.experimental.jit_scope
+    except AttributeError:
+        from tensorflow.contrib.compiler.jit import experimental_jit_scope \
+            as jit_scope
+    with jit_scope():
+        yield
+
+
+def get_shape(tensor):
+    # Return the static shape when it is fully defined, so that no `Shape` op
+    # (which reads `tensor`) is created.
+    if tensor.get_shape().is_fully_defined():
+        return tensor.get_shape().as_list()
+    return tf.shape(tensor)
+
+
+def get_size(tensor):
+    if tensor.get_shape().is_fully_defined():
+        return tensor.get_shape().num_elements()
+    return tf.size(tensor)
+
+
+def batched_normal(tensors, seed):
+    # Draw standard normal noise for all tensors with a single stateless RNG
+    # op, then split it into one noise tensor per input, shaped like that
+    # input.
+    shapes = [get_shape(t) for t in tensors]
+    sizes = [get_size(t) for t in tensors]
+    if all(isinstance(size, six.integer_types) for size in sizes):
+        total_size, split_sizes = sum(sizes), sizes
+    else:
+        total_size, split_sizes = tf.add_n(sizes), tf.stack(sizes)
+    flat_noise = tf.random.stateless_normal([total_size], seed)
+    return [tf.reshape(noise, shape) for noise, shape in zip(
+        tf.split(flat_noise, split_sizes, num=len(sizes)), shapes)]
+
+
+def maybe_resample_momentum(vs, t, n_iter_resample_v, sqrt_lr, seed):
+    # `n_iter_resample_v` is the value passed by the user, where ``None`` and
+    # 0 disable resampling. When it is disabled by a Python value, the
+    # resampling branch is left out of the graph entirely.
+    if n_iter_resample_v is None or (
+            isinstance(n_iter_resample_v, six.integer_types) and
+            n_iter_resample_v == 0):
+        return [tf.identity(v) for v in vs]
+    n_iter_resample_v = tf.convert_to_tensor(n_iter_resample_v, tf.int32)
+    # Decide once for all the momentum variables whether to resample them in
+    # this iteration, so that only one `tf.cond` is built per update.
+    resample_v = tf.logical_and(
+        tf.not_equal(n_iter_resample_v, 0),
+        tf.equal(tf.mod(t, tf.maximum(n_iter_resample_v, 1)), 0))
+    return tf.cond(
+        resample_v,
+        lambda: [sqrt_lr * noise for noise in batched_normal(vs, seed)],
+        lambda: [tf.identity(v) for v in vs],
+        strict=True)
+
+
+def langevin_step(q, grad, lr, sqrt_lr, noise, sqrt_preconditioner=None):
+    if sqrt_preconditioner is None:
+        return q + 0.5 * lr * grad + sqrt_lr * noise
+    return q + 0.5 * lr * tf.square(sqrt_preconditioner) * grad + \
+        sqrt_lr * sqrt_preconditioner * noise
+
+
+def sghmc_first_order_step(q, v, grad, decay, lr, gaussian_term):
+    new_v = decay * v + lr * grad + gaussian_term
+    return q + new_v, new_v
+
+
+def sghmc_second_order_step(q1, v, grad, decay_half, lr, gaussian_term):
+    new_v = decay_half * (decay_half * v + lr * grad + gaussian_term)
+    return q1 + 0.5 * new_v, new_v
+
+
 class SGMCMC(object):
     """
     Base class for stochastic gradient MCMC (SGMCMC) algorithms.
@@ -68,9 +151,43 @@ class SGMCMC(object):
     After getting the sample_op, the user can feed mini-batches to a data
     placeholder `observed` so that the gradient is a stochastic gradient. Then
     the user runs the sample_op like using HMC.
+
+    All subclasses accept a `use_xla` argument. When it is true, the noise
+    sampling and the arithmetic that computes the new values of the latent
+    and auxiliary variables (the momenta, preconditioners and frictions) are
+    marked for XLA compilation, so that they can be fused into a few kernels
+    instead of one kernel per arithmetic op. The gradients, the resampling of
+    the momenta, SGHMC's `mean_k` statistic and the assignments to the
+    variables are not compiled. This requires a Tensorflow build with XLA
+    support.
+
+    The update graph is built once by :meth:`sample`, and `sample_op` can be
+    run any number of times after that. To let XLA compile the whole
+    iteration, including the gradient of `log_joint`, turn on JIT compilation
+    for the session instead::
+
+        config = tf.ConfigProto()
+        config.graph_options.optimizer_options.global_jit_level = \\
+            tf.OptimizerOptions.ON_1
+        with tf.Session(config=config) as sess:
+            ...
     """
-    def __init__(self):
+    # Number of noise draws in each iteration (see `_step_seed`).
+    _n_draws = 1
+
+    def __init__(self, use_xla=False):
         self.t = tf.Variable(0, name="t", trainable=False, dtype=tf.int32)
+        # Key of the stateless RNG, fixed when the sampler is constructed. It
+        # is derived from the graph-level random seed when that is set, and
+        # drawn at random otherwise, so that different samplers (and runs)
+        # use different noise streams. It is a Python int rather than a
+        # variable, so checkpoints do not depend on it.
+        graph_seed, op_seed = tf.get_seed(None)
+        if graph_seed is None:
+            self._seed = random.randint(0, 2**30 - 1)
+        else:
+            self._seed = hash((graph_seed, op_seed)) % 2**30
+        self.use_xla = use_xla
 
     def _make_grad_func(self, meta_bn, observed, latent):
         if callable(meta_bn):
@@ -104,8 +221,10 @@ class SGMCMC(object):
         self._define_variables(qs)
         update_ops, infos = self._update(qs, grad_func)
 
-        with tf.control_dependencies([self.t.assign_add(1)]):
-            sample_op = tf.group(*update_ops)
+        # The per-step noise is seeded by `t`, so `t` is only increased after
+        # all the updates which read it are done.
+        with tf.control_dependencies(update_ops):
+            sample_op = tf.group(self.t.assign_add(1))
         list_attrib = zip(*map(lambda d: six.itervalues(d), infos))
         list_attrib_with_k = map(lambda l: dict(zip(self._latent_k, l)),
                                  list_attrib)
@@ -116,6 +235,12 @@ class SGMCMC(object):
 
         return sample_op, sgmcmc_info
 
+    def _step_seed(self, salt):
+        # Seed of the `salt`-th noise draw in the current iteration. The key
+        # is kept as is and the draws are counted in the other component, so
+        # that the streams of samplers with different keys never overlap.
+        return tf.stack([self._seed, self.t * self._n_draws + salt])
+
     def sample(self, meta_bn, observed, latent):
         """
         Return the sampling `Operation` that runs a SGMCMC iteration and the
@@ -156,6 +281,11 @@ class SGMCMC(object):
             `q`, representing the updated values of latent variables. To check
             out other attributes, see the documentation for the specific
             subclass below.
+
+            Statistics in `sgmcmc_info` which the update itself does not
+            depend on (e.g., `mean_k` of :class:`SGHMC`) are only computed
+            when they are fetched, so running `sample_op` alone does not pay
+            for them.
         """
         grad_func = self._make_grad_func(meta_bn, observed, latent)
         return self._apply_updates(grad_func)
@@ -179,25 +309,32 @@ class SGLD(SGMCMC):
 
     :param learning_rate: A 0-D `float32` Tensor. It can be either a constant
         or a placeholder for decaying learning rate.
+    :param use_xla: A `bool` indicating whether to compile the elementwise
+        update with XLA.
     """
-    def __init__(self, learning_rate):
+    def __init__(self, learning_rate, use_xla=False):
         self.lr = tf.convert_to_tensor(
             learning_rate, tf.float32, name="learning_rate")
-        super(SGLD, self).__init__()
+        self._sqrt_lr = tf.sqrt(self.lr)
+        super(SGLD, self).__init__(use_xla)
 
     def _define_variables(self, qs):
         pass
 
     def _update(self, qs, grad_func):
-        return zip(*[self._update_single(q, grad)
-                     for q, grad in zip(qs, grad_func(qs))])
+        grads = grad_func(qs)
+        # The noise and all the steps are built in one scope, so that XLA can
+        # fuse the sampling with the steps consuming it.
+        with xla_scope(self.use_xla):
+            noises = batched_normal(qs, self._step_seed(0))
+            new_qs = [self._update_single(q, grad, noise)
+                      for q, grad, noise in zip(qs, grads, noises)]
+        update_qs = [q.assign(new_q) for (q, new_q) in zip(qs, new_qs)]
+        infos = [{"q": new_q} for new_q in new_qs]
+        return update_qs, infos
 
-    def _update_single(self, q, grad):
-        new_q = q + 0.5 * self.lr * grad + tf.random_normal(
-            tf.shape(q), stddev=tf.sqrt(self.lr))
-        update_q = q.assign(new_q)
-        info = {"q": new_q}
-        return update_q, info
+    def _update_single(self, q, grad, noise):
+        return langevin_step(q, grad, self.lr, self._sqrt_lr, noise)
 
 
 class PSGLD(SGLD):
@@ -214,6 +351,17 @@ class PSGLD(SGLD):
 
     :param learning_rate: A 0-D `float32` Tensor. It can be either a constant
         or a placeholder for decaying learning rate.
+    :param preconditioner: A string. The name of the preconditioner. Currently
+        only ``'rms'`` is supported.
+    :param preconditioner_hparams: A namedtuple of hyperparameters of the
+        preconditioner. If ``None``, the default ones will be used.
+    :param preconditioner_dtype: The `DType` used to store the auxiliary
+        statistics of the preconditioner, which are as large as the latent
+        variables. Using ``tf.bfloat16`` halves their memory and bandwidth,
+        at the cost of a less accurate preconditioner. The update itself is
+        always computed in the precision of the gradients.
+    :param use_xla: A `bool` indicating whether to compile the elementwise
+        update with XLA.
     """
 
     class RMSPreconditioner:
@@ -222,39 +370,57 @@ class PSGLD(SGLD):
         default_hps = HParams(decay=0.9, epsilon=1e-3)
 
         @staticmethod
-        def _define_variables(qs):
-            return [tf.Variable(tf.zeros_like(q)) for q in qs]
+        def _define_variables(qs, dtype):
+            return [tf.Variable(tf.zeros(get_shape(q), dtype=dtype),
+                                trainable=False, use_resource=True)
+                    for q in qs]
 
         @staticmethod
-        def _get_preconditioner(hps, q, grad, aux):
-            aux = tf.assign(aux, hps.decay * aux + (1-hps.decay) * grad**2)
-            return 1 / (hps.epsilon + tf.sqrt(aux))
+        def _get_sqrt_preconditioner(hps, q, grad, aux):
+            # Square root of the preconditioner 1 / (epsilon + sqrt(aux)),
+            # computed with `rsqrt` instead of a division and another sqrt.
+            aux = tf.cast(aux, grad.dtype)
+            new_aux = hps.decay * aux + (1-hps.decay) * tf.square(grad)
+            return tf.rsqrt(hps.epsilon + tf.sqrt(new_aux)), new_aux
 
     def __init__(self, learning_rate, preconditioner='rms',
-                 preconditioner_hparams=None):
+                 preconditioner_hparams=None, preconditioner_dtype=tf.float32,
+                 use_xla=False):
         self.preconditioner = {
             'rms': PSGLD.RMSPreconditioner
         }[preconditioner]
         if preconditioner_hparams is None:
             preconditioner_hparams = self.preconditioner.default_hps
         self.preconditioner_hparams = preconditioner_hparams
-        super(PSGLD, self).__init__(learning_rate)
+        self.preconditioner_dtype = tf.as_dtype(preconditioner_dtype)
+        super(PSGLD, self).__init__(learning_rate, use_xla)
 
     def _define_variables(self, qs):
-        self.vs = self.preconditioner._define_variables(qs)
+        self.vs = self.preconditioner._define_variables(
+            qs, self.preconditioner_dtype)
 
     def _update(self, qs, grad_func):
-        return zip(*[self._update_single(q, grad, aux)
-                     for q, grad, aux in zip(qs, grad_func(qs), self.vs)])
-
-    def _update_single(self, q, grad, aux):
-        g = self.preconditioner._get_preconditioner(
+        grads = grad_func(qs)
+        # The noise, the preconditioners and all the steps are built in one
+        # scope, so that XLA can fuse them into one elementwise update.
+        with xla_scope(self.use_xla):
+            noises = batched_normal(qs, self._step_seed(0))
+            new_qs, new_auxs = zip(*[
+                self._update_single(q, grad, noise, aux)
+                for q, grad, noise, aux in zip(qs, grads, noises, self.vs)])
+        update_qs = [q.assign(new_q) for (q, new_q) in zip(qs, new_qs)]
+        update_auxs = [aux.assign(new_aux)
+                       for (aux, new_aux) in zip(self.vs, new_auxs)]
+        infos = [{"q": new_q} for new_q in new_qs]
+        return update_qs + update_auxs, infos
+
+    def _update_single(self, q, grad, noise, aux):
+        # The preconditioner is computed without assigning to `aux`, so that
+        # it can be fused with the Langevin step.
+        sqrt_g, new_aux = self.preconditioner._get_sqrt_preconditioner(
             self.preconditioner_hparams, q, grad, aux)
-        new_q = q + 0.5 * self.lr * g * grad + tf.random_normal(
-            tf.shape(q), stddev=tf.sqrt(self.lr * g))
-        update_q = q.assign(new_q)
-        info = {"q": new_q}
-        return update_q, info
+        new_q = langevin_step(q, grad, self.lr, self._sqrt_lr, noise, sqrt_g)
+        return new_q, tf.cast(new_aux, aux.dtype)
 
 
 class SGHMC(SGMCMC):
@@ -301,62 +467,72 @@ class SGHMC(SGMCMC):
     :param second_order: A `bool` Tensor indicating whether to enable the
         2nd-order integrator introduced in (Chen et al., 2015) or to use the
         ordinary 1st-order integrator.
+    :param use_xla: A `bool` indicating whether to compile the elementwise
+        update with XLA.
     """
+    # The momentum resampling and the gaussian terms.
+    _n_draws = 2
+
     def __init__(self, learning_rate, friction=0.25, variance_estimate=0.,
-                 n_iter_resample_v=20, second_order=True):
+                 n_iter_resample_v=20, second_order=True, use_xla=False):
         self.lr = tf.convert_to_tensor(
             learning_rate, tf.float32, name="learning_rate")
         self.alpha = tf.convert_to_tensor(
             friction, tf.float32, name="alpha")
         self.beta = tf.convert_to_tensor(
             variance_estimate, tf.float32, name="beta")
-        if n_iter_resample_v is None:
-            n_iter_resample_v = 0
-        self.n_iter_resample_v = tf.convert_to_tensor(
-            n_iter_resample_v, tf.int32, name="n_iter_resample_v")
+        # Kept as passed, so that `maybe_resample_momentum` can leave the
+        # resampling out of the graph when it is disabled.
+        self.n_iter_resample_v = n_iter_resample_v
         self.second_order = second_order
-        super(SGHMC, self).__init__()
+        self._sqrt_lr = tf.sqrt(self.lr)
+        self._noise_std = tf.sqrt(2*(self.alpha-self.beta)*self.lr)
+        # Momentum decay factors of the 1st and 2nd-order integrators.
+        self._decay = 1 - self.alpha
+        self._decay_half = tf.exp(-0.5*self.alpha)
+        super(SGHMC, self).__init__(use_xla)
 
     def _define_variables(self, qs):
         # Define the augmented momentum variables.
         self.vs = [
-            tf.Variable(tf.random_normal(tf.shape(q), stddev=tf.sqrt(self.lr)))
+            tf.Variable(
+                tf.random_normal(get_shape(q), stddev=self._sqrt_lr),
+                trainable=False, use_resource=True)
             for q in qs]
 
     def _update(self, qs, grad_func):
-        def resample_momentum(v):
-            return tf.random_normal(tf.shape(v), stddev=tf.sqrt(self.lr))
-
-        old_vs = [
-            tf.cond(
-                tf.equal(self.n_iter_resample_v, 0),
-                lambda: v,
-                lambda: tf.cond(
-                    tf.equal(tf.mod(self.t, self.n_iter_resample_v), 0),
-                    lambda: resample_momentum(v), lambda: v))
-            for v in self.vs]
-        gaussian_terms = [
-            tf.random_normal(
-                tf.shape(old_v),
-                stddev=tf.sqrt(2*(self.alpha-self.beta)*self.lr))
-            for old_v in old_vs]
+        old_vs = maybe_resample_momentum(
+            self.vs, self.t, self.n_iter_resample_v, self._sqrt_lr,
+            self._step_seed(0))
+
+        # The gaussian terms are drawn right next to the momentum update that
+        # consumes them, so that the sampling can be fused into it.
+        def gaussian_terms():
+            return [self._noise_std * noise
+                    for noise in batched_normal(old_vs, self._step_seed(1))]
+
         if not self.second_order:
-            new_vs = [
-                (1 - self.alpha) * old_v + self.lr * grad + gaussian_term
-                for (old_v, grad, gaussian_term) in zip(
-                        old_vs, grad_func(qs), gaussian_terms)]
-            new_qs = [q + new_v for (q, new_v) in zip(qs, new_vs)]
+            grads = grad_func(qs)
+            with xla_scope(self.use_xla):
+                new_qs, new_vs = zip(*[
+                    sghmc_first_order_step(
+                        q, old_v, grad, self._decay, self.lr, gaussian_term)
+                    for (q, old_v, grad, gaussian_term) in zip(
+                        qs, old_vs, grads, gaussian_terms())])
         else:
-            decay_half = tf.exp(-0.5*self.alpha)
-            q1s = [q + 0.5 * old_v for (q, old_v) in zip(qs, old_vs)]
-            new_vs = [
-                decay_half * (
-                    decay_half * old_v + self.lr * grad + gaussian_term)
-                for (old_v, grad, gaussian_term) in zip(
-                        old_vs, grad_func(q1s), gaussian_terms)]
-            new_qs = [q1 + 0.5 * new_v for (q1, new_v) in zip(q1s, new_vs)]
-
-        mean_ks = [tf.reduce_mean(new_v**2) for new_v in new_vs]
+            with xla_scope(self.use_xla):
+                q1s = [q + 0.5 * old_v for (q, old_v) in zip(qs, old_vs)]
+            grads = grad_func(q1s)
+            with xla_scope(self.use_xla):
+                new_qs, new_vs = zip(*[
+                    sghmc_second_order_step(
+                        q1, old_v, grad, self._decay_half, self.lr,
+                        gaussian_term)
+                    for (q1, old_v, grad, gaussian_term) in zip(
+                        q1s, old_vs, grads, gaussian_terms())])
+        new_qs, new_vs = list(new_qs), list(new_vs)
+
+        mean_ks = [tf.reduce_mean(tf.square(new_v)) for new_v in new_vs]
         infos = [{"q": new_q, "mean_k": mean_k}
                  for (new_q, mean_k) in zip(new_qs, mean_ks)]
 
@@ -365,10 +541,9 @@ class SGHMC(SGMCMC):
             update_vs = [v.assign(new_v)
                          for (v, new_v) in zip(self.vs, new_vs)]
 
-        update_ops = [tf.group(update_q, update_v)
-                      for (update_q, update_v) in zip(update_qs, update_vs)]
-
-        return update_ops, infos
+        # `sample_op` groups all of the assignments at once, so there is no
+        # need for an additional group per latent variable.
+        return update_qs + update_vs, infos
 
 
 class SGNHT(SGMCMC):
@@ -393,12 +568,14 @@ class SGNHT(SGMCMC):
     * **mean_k** - The mean kinetic energy of updated momentum variables
       corresponding to the latent variables. If `use_vector_alpha==True`, each
       item has the same shape as the corresponding latent variable; else, each
-      item is a scalar.
+      item is a scalar. If `share_alpha==True`, all items are the same
+      scalar.
 
     * **alpha** - The values of friction variables :math:`\\alpha`
       corresponding to the latent variables. If `use_vector_alpha==True`, each
       item has the same shape as the corresponding latent variable; else, each
-      item is a scalar.
+      item is a scalar. If `share_alpha==True`, all items are the same
+      scalar.
 
     :param learning_rate: A 0-D `float32` Tensor corresponding to :math:`\eta`
         in Eq.(**). Note that it does not scale the same as `learning_rate` in
@@ -427,86 +604,131 @@ class SGNHT(SGMCMC):
         shape as the latent variable. That is, each component of the latent
         variable corresponds to an independently tunable friction. Else, the
         friction is a scalar.
+    :param share_alpha: A `bool` indicating whether all latent variables
+        share one scalar friction :math:`\\alpha`, which is tuned by the mean
+        kinetic energy over all components of their momentum variables (as in
+        Algorithm 2, where the latent variables are treated as one vector).
+        Else, each latent variable has its own friction. Only valid when
+        `use_vector_alpha` is false.
+    :param use_xla: A `bool` indicating whether to compile the elementwise
+        update with XLA.
     """
+    # The momentum resampling and the gaussian terms.
+    _n_draws = 2
+
     def __init__(self, learning_rate, variance_extra=0., tune_rate=1.,
                  n_iter_resample_v=None, second_order=True,
-                 use_vector_alpha=True):
+                 use_vector_alpha=True, share_alpha=False, use_xla=False):
         self.lr = tf.convert_to_tensor(
             learning_rate, tf.float32, name="learning_rate")
         self.a = tf.convert_to_tensor(
             variance_extra, tf.float32, name="variance_extra")
         self.tune_rate = tf.convert_to_tensor(
             tune_rate, tf.float32, name="tune_rate")
-        if n_iter_resample_v is None:
-            n_iter_resample_v = 0
-        self.n_iter_resample_v = tf.convert_to_tensor(
-            n_iter_resample_v, tf.int32, name="n_iter_resample_v")
+        # Kept as passed, so that `maybe_resample_momentum` can leave the
+        # resampling out of the graph when it is disabled.
+        self.n_iter_resample_v = n_iter_resample_v
         self.second_order = second_order
         self.use_vector_alpha = use_vector_alpha
-        super(SGNHT, self).__init__()
+        if use_vector_alpha and share_alpha:
+            raise ValueError("share_alpha requires use_vector_alpha to be "
+                             "False.")
+        self.share_alpha = share_alpha
+        self._sqrt_lr = tf.sqrt(self.lr)
+        self._noise_std = tf.sqrt(2*self.a*self.lr)
+        super(SGNHT, self).__init__(use_xla)
 
     def _define_variables(self, qs):
         # Define the augmented momentum variables.
         self.vs = [
-            tf.Variable(tf.random_normal(tf.shape(q), stddev=tf.sqrt(self.lr)))
+            tf.Variable(
+                tf.random_normal(get_shape(q), stddev=self._sqrt_lr),
+                trainable=False, use_resource=True)
             for q in qs]
         # Define the augmented friction variables.
         if self.use_vector_alpha:
-            self.alphas = [tf.Variable(self.a*tf.ones(tf.shape(q)))
+            self.alphas = [tf.Variable(self.a*tf.ones(get_shape(q)),
+                                       trainable=False, use_resource=True)
                            for q in qs]
+        elif self.share_alpha:
+            self.alphas = [tf.Variable(self.a, trainable=False,
+                                       use_resource=True)]
         else:
-            self.alphas = [tf.Variable(self.a) for q in qs]
+            self.alphas = [tf.Variable(self.a, trainable=False,
+                                       use_resource=True) for q in qs]
 
     def _update(self, qs, grad_func):
-        def resample_momentum(v):
-            return tf.random_normal(tf.shape(v), stddev=tf.sqrt(self.lr))
-
-        def maybe_reduce_mean(tensor):
+        # Values related to the friction variables are kept in lists aligned
+        # with `self.alphas`, which has a single item if `share_alpha` is
+        # true. `per_latent` expands such a list to one item per latent.
+        def per_latent(values):
+            if self.share_alpha:
+                return values * len(qs)
+            return values
+
+        def mean_kinetics(vs):
             if self.use_vector_alpha:
-                return tensor
+                return [tf.square(v) for v in vs]
+            elif self.share_alpha:
+                sum_k = tf.add_n([tf.reduce_sum(tf.square(v)) for v in vs])
+                sizes = [get_size(v) for v in vs]
+                if all(isinstance(size, six.integer_types)
+                       for size in sizes):
+                    size = sum(sizes)
+                else:
+                    size = tf.add_n(sizes)
+                return [sum_k / tf.cast(size, sum_k.dtype)]
             else:
-                return tf.reduce_mean(tensor)
-
-        old_vs = [
-            tf.cond(
-                tf.equal(self.n_iter_resample_v, 0),
-                lambda: v,
-                lambda: tf.cond(
-                    tf.equal(tf.mod(self.t, self.n_iter_resample_v), 0),
-                    lambda: resample_momentum(v),
-                    lambda: v))
-            for v in self.vs]
-        gaussian_terms = [
-            tf.random_normal(tf.shape(old_v), stddev=tf.sqrt(2*self.a*self.lr))
-            for old_v in old_vs]
+                return [tf.reduce_mean(tf.square(v)) for v in vs]
+
+        old_vs = maybe_resample_momentum(
+            self.vs, self.t, self.n_iter_resample_v, self._sqrt_lr,
+            self._step_seed(0))
+
+        # The gaussian terms are drawn right next to the momentum update that
+        # consumes them, so that the sampling can be fused into it.
+        def gaussian_terms():
+            return [self._noise_std * noise
+                    for noise in batched_normal(old_vs, self._step_seed(1))]
+
         if not self.second_order:
-            new_vs = [
-                (1 - alpha) * old_v + self.lr * grad + gaussian_term
-                for (old_v, alpha, grad, gaussian_term) in zip(
-                        old_vs, self.alphas, grad_func(qs), gaussian_terms)]
-            new_qs = [q + new_v for (q, new_v) in zip(qs, new_vs)]
-            mean_ks = [maybe_reduce_mean(new_v**2) for new_v in new_vs]
-            new_alphas = [alpha + self.tune_rate * (mean_k - self.lr)
-                          for (alpha, mean_k) in zip(self.alphas, mean_ks)]
+            grads = grad_func(qs)
+            with xla_scope(self.use_xla):
+                new_qs, new_vs = zip(*[
+                    sghmc_first_order_step(
+                        q, old_v, grad, 1 - alpha, self.lr, gaussian_term)
+                    for (q, old_v, alpha, grad, gaussian_term) in zip(
+                        qs, old_vs, per_latent(self.alphas), grads,
+                        gaussian_terms())])
+                mean_ks = mean_kinetics(new_vs)
+                new_alphas = [
+                    alpha + self.tune_rate * (mean_k - self.lr)
+                    for (alpha, mean_k) in zip(self.alphas, mean_ks)]
         else:
-            q1s = [q + 0.5 * old_v for (q, old_v) in zip(qs, old_vs)]
-            mean_k1s = [maybe_reduce_mean(old_v**2) for old_v in old_vs]
-            alpha1s = [alpha + 0.5 * self.tune_rate * (mean_k1 - self.lr)
-                       for (alpha, mean_k1) in zip(self.alphas, mean_k1s)]
-            decay_halfs = [tf.exp(-0.5*alpha1) for alpha1 in alpha1s]
-            new_vs = [
-                decay_half * (
-                    decay_half * old_v + self.lr * grad + gaussian_term)
-                for (decay_half, old_v, grad, gaussian_term) in zip(
-                        decay_halfs, old_vs, grad_func(q1s), gaussian_terms)]
-            new_qs = [q1 + 0.5 * new_v for (q1, new_v) in zip(q1s, new_vs)]
-            mean_ks = [maybe_reduce_mean(new_v**2) for new_v in new_vs]
-            new_alphas = [alpha1 + 0.5 * self.tune_rate * (mean_k - self.lr)
-                          for (alpha1, mean_k) in zip(alpha1s, mean_ks)]
+            with xla_scope(self.use_xla):
+                q1s = [q + 0.5 * old_v for (q, old_v) in zip(qs, old_vs)]
+                mean_k1s = mean_kinetics(old_vs)
+                alpha1s = [
+                    alpha + 0.5 * self.tune_rate * (mean_k1 - self.lr)
+                    for (alpha, mean_k1) in zip(self.alphas, mean_k1s)]
+                decay_halfs = [tf.exp(-0.5*alpha1) for alpha1 in alpha1s]
+            grads = grad_func(q1s)
+            with xla_scope(self.use_xla):
+                new_qs, new_vs = zip(*[
+                    sghmc_second_order_step(
+                        q1, old_v, grad, decay_half, self.lr, gaussian_term)
+                    for (q1, old_v, grad, decay_half, gaussian_term) in zip(
+                        q1s, old_vs, grads, per_latent(decay_halfs),
+                        gaussian_terms())])
+                mean_ks = mean_kinetics(new_vs)
+                new_alphas = [
+                    alpha1 + 0.5 * self.tune_rate * (mean_k - self.lr)
+                    for (alpha1, mean_k) in zip(alpha1s, mean_ks)]
+        new_qs, new_vs = list(new_qs), list(new_vs)
 
         infos = [{"q": new_q, "mean_k": mean_k, "alpha": new_alpha}
                  for (new_q, mean_k, new_alpha) in zip(
-                      new_qs, mean_ks, new_alphas)]
+                      new_qs, per_latent(mean_ks), per_latent(new_alphas))]
 
         with tf.control_dependencies(new_vs + new_qs + new_alphas):
             update_qs = [q.assign(new_q) for (q, new_q) in zip(qs, new_qs)]
@@ -515,9 +737,6 @@ class SGNHT(SGMCMC):
             update_alphas = [alpha.assign(new_alpha) for (alpha, new_alpha)
                              in zip(self.alphas, new_alphas)]
 
-        update_ops = [
-            tf.group(update_q, update_v, update_alpha)
-            for (update_q, update_v, update_alpha) in zip(
-                    update_qs, update_vs, update_alphas)]
-
-        return update_ops, infos
+        # `sample_op` groups all of the assignments at once, so there is no
+        # need for an additional group per latent variable.
+        return update_qs + update_vs + update_alphas, infos